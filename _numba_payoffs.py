@@ -0,0 +1,18 @@
+"""JIT-compiled payoff kernel for Game.simulate_batch. Needs numba; imported only on demand."""
+import numba
+import numpy as np
+
+
+@numba.njit(parallel=True, fastmath=True, cache=True)
+def payoffs_batch(decisions, multiplier, inv_limit):
+    """Payoffs for a C-contiguous (n_games, n_players) float64 array of investments."""
+    n_games, n_players = decisions.shape
+    out = np.empty_like(decisions)
+    for g in numba.prange(n_games):
+        total = 0.0
+        for i in range(n_players):
+            total += decisions[g, i]
+        share = total * multiplier / n_players
+        for i in range(n_players):
+            out[g, i] = (inv_limit - decisions[g, i]) + share
+    return out
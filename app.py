@@ -1,24 +1,45 @@
 import os
-import json
+import time
 import uuid
-from flask import Flask, render_template, request, redirect, url_for, session, send_from_directory
+import zlib
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, redirect, url_for, session, send_from_directory, flash
 from flask_session import Session
 from game_logic import (
     Player, LLMAgent, Game, load_players, save_players,
-    load_json_data, PERSONALITIES_FILE, RECORDS_DIR
+    load_json_data, save_json_data, dumps_json, loads_json, find_game_record, PLAYERS_FILE, PERSONALITIES_FILE, RECORDS_DIR
 )
 
 # --- Flask App Setup ---
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.urandom(24)
 
-# Configure server-side sessions
-app.config["SESSION_TYPE"] = "filesystem"
-app.config["SESSION_FILE_DIR"] = "./flask_session"
+# Configure server-side sessions. Set SESSION_REDIS_URL (e.g. redis://localhost:6379/0)
+# to keep game state in Redis; otherwise sessions are stored as files on local disk.
+SESSION_REDIS_URL = os.environ.get("SESSION_REDIS_URL")
+if SESSION_REDIS_URL:
+    import redis
+    app.config["SESSION_TYPE"] = "redis"
+    app.config["SESSION_REDIS"] = redis.from_url(SESSION_REDIS_URL)
+else:
+    app.config["SESSION_TYPE"] = "filesystem"
+    app.config["SESSION_FILE_DIR"] = "./flask_session"
+    # Ensure the session directory exists
+    os.makedirs(app.config["SESSION_FILE_DIR"], exist_ok=True)
 Session(app)
 
-# Ensure the session directory exists
-os.makedirs(app.config["SESSION_FILE_DIR"], exist_ok=True)
+# All-AI games are simulated on this pool instead of inside the request. Finished game
+# states are written to SIMULATIONS_DIR so any worker process can pick them up.
+SIMULATIONS_DIR = 'simulations'
+MAX_CONCURRENT_SIMULATIONS = int(os.environ.get("MAX_CONCURRENT_SIMULATIONS", 4))
+simulation_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SIMULATIONS)
+# Seconds a browser keeps polling for a result. A simulation whose worker process was
+# restarted or killed never writes one, so polling gives up after this.
+SIMULATION_TIMEOUT = int(os.environ.get("SIMULATION_TIMEOUT", 900))
+# Serializes read-modify-write updates of the players file within this process
+_roster_lock = threading.Lock()
 
 
 # --- New Function to Run All-AI Games ---
@@ -27,16 +48,93 @@ def run_full_ai_game(game):
     Runs an all-AI game from start to finish on the server.
     """
     print(f"--- Running full simulation for Game ID: {game.game_id} ---")
+    asyncio.run(_run_full_ai_game_async(game))
+    print(f"--- Simulation for {game.game_id} complete. ---")
+    return game
+
+
+async def _run_full_ai_game_async(game):
+    """Drives the game phases, issuing each phase's LLM calls concurrently."""
     while game.phase != "GAMEOVER":
         if game.phase == "INVESTMENT":
             print(f"Simulating Round {game.current_round + 1} - Investment Phase...")
-            game.process_investment_round()
+            await game.aprocess_investment_round()
         elif game.phase == "DISCUSSION":
             print(f"Simulating Round {game.current_round} - Discussion Phase...")
-            game.process_discussion_round()
-    
-    print(f"--- Simulation for {game.game_id} complete. ---")
-    return game
+            await game.aprocess_discussion_round()
+
+
+def _sync_banks(all_players, game):
+    """Copies final banks from a finished game onto the matching roster players."""
+    roster = {p.player_id: p for p in all_players}
+    for final_player in game.players:
+        if final_player.player_id in roster:
+            roster[final_player.player_id].bank = final_player.bank
+
+
+def _save_final_banks(game):
+    """Writes a finished game's player banks back to the persistent roster."""
+    with _roster_lock:
+        try:
+            all_players = load_players(strict=True)
+        except ValueError as e:
+            # Saving now would replace the whole roster with just what could be read
+            print(f"Not saving banks for {game.game_id}: {PLAYERS_FILE} could not be loaded ({e})")
+            return
+        _sync_banks(all_players, game)
+        save_players(all_players)
+
+
+def _pack_state(game_state):
+    """Serializes and compresses a game state dict for storage in the session."""
+    return zlib.compress(dumps_json(game_state))
+
+
+def _unpack_state(packed):
+    if not packed: return None
+    # Sessions from before state was compressed hold the game state dict itself
+    if isinstance(packed, dict): return packed
+    return loads_json(zlib.decompress(packed))
+
+
+def _simulation_path(game_id):
+    return os.path.join(SIMULATIONS_DIR, f"{game_id}.json")
+
+
+def run_full_ai_game_task(game):
+    """Background task: simulates an all-AI game and stores its final state for polling."""
+    try:
+        completed_game = run_full_ai_game(game)
+        _save_final_banks(completed_game)
+        result = completed_game.to_dict()
+    except Exception as e:
+        print(f"Simulation for {game.game_id} failed: {e}")
+        result = {"error": str(e)}
+    os.makedirs(SIMULATIONS_DIR, exist_ok=True)
+    # save_json_data writes then renames, so a poll never sees a half-written file
+    save_json_data(result, _simulation_path(game.game_id), indent=False)
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+# (file stamps, roster dicts, personalities) for the setup page; rebuilt only when
+# players.json or personalities.json change on disk.
+_setup_cache = (None, None, None)
+
+def _setup_page_data():
+    global _setup_cache
+    stamps = (_file_stamp(PLAYERS_FILE), _file_stamp(PERSONALITIES_FILE))
+    if _setup_cache[0] != stamps:
+        # Convert player objects to dictionaries for JSON serialization in the template
+        persistent_players_dict = [p.to_dict() for p in load_players()]
+        _setup_cache = (stamps, persistent_players_dict, load_json_data(PERSONALITIES_FILE))
+    return _setup_cache[1], _setup_cache[2]
 
 
 # --- Web Routes ---
@@ -44,12 +142,7 @@ def run_full_ai_game(game):
 @app.route('/')
 def setup_page():
     """Displays the main game setup page."""
-    all_players = load_players()
-    personalities = load_json_data(PERSONALITIES_FILE)
-    
-    # Convert player objects to dictionaries for JSON serialization in the template
-    persistent_players_dict = [p.to_dict() for p in all_players]
-
+    persistent_players_dict, personalities = _setup_page_data()
     return render_template(
         'setup.html',
         persistent_players=persistent_players_dict,
@@ -106,30 +199,22 @@ def start_game():
 
     # --- CHANGE: Logic to handle observer vs. interactive games ---
     if not game.get_human_player():
-        # This is an all-AI (observer) game. Run it on the server.
-        completed_game = run_full_ai_game(game)
-
-        # Update the master player list with final banks
-        for final_player in completed_game.players:
-            for p in all_players:
-                if p.player_id == final_player.player_id:
-                    p.bank = final_player.bank
-                    break
-        save_players(all_players)
-
-        # Save the completed game to the session and go to results
-        session['game_state'] = completed_game.to_dict()
-        return redirect(url_for('results_page'))
+        # This is an all-AI (observer) game. Simulate it in the background and poll for the result.
+        simulation_executor.submit(run_full_ai_game_task, game)
+        session.pop('game_state', None)
+        session['pending_game_id'] = game_id
+        session['pending_deadline'] = time.time() + SIMULATION_TIMEOUT
+        return redirect(url_for('simulation_status', game_id=game_id))
     else:
         # This is an interactive game with a human player.
-        session['game_state'] = game.to_dict()
+        session['game_state'] = _pack_state(game.to_dict())
         return redirect(url_for('game_page'))
 
 
 @app.route('/game')
 def game_page():
     """Displays the main interactive game screen."""
-    game_state = session.get('game_state')
+    game_state = _unpack_state(session.get('game_state'))
     if not game_state: return redirect(url_for('setup_page'))
     game = Game.from_dict(game_state)
     return render_template('game.html', game=game)
@@ -138,7 +223,7 @@ def game_page():
 @app.route('/submit_action', methods=['POST'])
 def submit_action():
     """Handles form submissions from the human player (investment or statement)."""
-    game_state = session.get('game_state')
+    game_state = _unpack_state(session.get('game_state'))
     if not game_state: return redirect(url_for('setup_page'))
     game = Game.from_dict(game_state)
 
@@ -149,16 +234,10 @@ def submit_action():
         statement = request.form.get('statement', 'pass')
         game.process_discussion_round(human_statement=statement)
 
-    session['game_state'] = game.to_dict()
+    session['game_state'] = _pack_state(game.to_dict())
 
     if game.phase == "GAMEOVER":
-        all_players = load_players()
-        for final_player in game.players:
-            for p in all_players:
-                if p.player_id == final_player.player_id:
-                    p.bank = final_player.bank
-                    break
-        save_players(all_players)
+        _save_final_banks(game)
         return redirect(url_for('results_page'))
     
     return redirect(url_for('game_page'))
@@ -168,7 +247,7 @@ def submit_action():
 def run_ai_turn():
     """Handles the button click for advancing turns in observer mode."""
     # This route is now a fallback but can be kept for step-by-step observation if needed later.
-    game_state = session.get('game_state')
+    game_state = _unpack_state(session.get('game_state'))
     if not game_state: return redirect(url_for('setup_page'))
     game = Game.from_dict(game_state)
 
@@ -177,16 +256,10 @@ def run_ai_turn():
     elif game.phase == "DISCUSSION":
         game.process_discussion_round()
     
-    session['game_state'] = game.to_dict()
+    session['game_state'] = _pack_state(game.to_dict())
 
     if game.phase == "GAMEOVER":
-        all_players = load_players()
-        for final_player in game.players:
-            for p in all_players:
-                if p.player_id == final_player.player_id:
-                    p.bank = final_player.bank
-                    break
-        save_players(all_players)
+        _save_final_banks(game)
         return redirect(url_for('results_page'))
 
     return redirect(url_for('game_page'))
@@ -195,23 +268,47 @@ def run_ai_turn():
 @app.route('/results')
 def results_page():
     """Displays the final results of the game."""
-    game_state = session.get('game_state')
+    game_state = _unpack_state(session.get('game_state'))
     if not game_state: return redirect(url_for('setup_page'))
     game = Game.from_dict(game_state)
     return render_template('results.html', game=game)
 
 
+@app.route('/results/<game_id>')
+def simulation_status(game_id):
+    """Polled while an all-AI game simulates; shows the results once it has finished."""
+    if session.get('pending_game_id') != game_id:
+        return redirect(url_for('results_page'))
+    path = _simulation_path(game_id)
+    try:
+        with open(path, 'rb') as f:
+            result = loads_json(f.read())
+        os.remove(path)
+    except FileNotFoundError:
+        # Not finished yet, or an overlapping poll has just collected it
+        if time.time() > session.get('pending_deadline', float('inf')):
+            session.pop('pending_game_id', None)
+            session.pop('pending_deadline', None)
+            flash(f"The simulation of {game_id} did not finish within {SIMULATION_TIMEOUT} seconds. Please start a new game.")
+            return redirect(url_for('setup_page'))
+        return render_template('simulating.html', game_id=game_id), 202
+
+    session.pop('pending_game_id', None)
+    session.pop('pending_deadline', None)
+    if 'error' in result:
+        return f"Simulation of {game_id} failed: {result['error']}", 500
+    session['game_state'] = _pack_state(result)
+    return redirect(url_for('results_page'))
+
+
 @app.route('/download/<game_id>')
 def download_record(game_id):
     """
-    Finds the correct timestamped filename for download.
+    Looks up the timestamped filename for download.
     """
-    try:
-        for filename in os.listdir(RECORDS_DIR):
-            if game_id in filename and filename.endswith('.csv'):
-                return send_from_directory(RECORDS_DIR, filename, as_attachment=True)
-    except FileNotFoundError:
-        pass # Directory might not exist yet
+    filename = find_game_record(game_id)
+    if filename:
+        return send_from_directory(RECORDS_DIR, filename, as_attachment=True)
     return "Record not found.", 404
 
 
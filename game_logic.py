@@ -1,19 +1,40 @@
 import os
+import csv
 import json
 import uuid
+import asyncio
+import atexit
+import hashlib
+import threading
 import random
+import re
 import datetime # Import the datetime module
+import functools
+from collections import OrderedDict
 from dotenv import load_dotenv
-import google.generativeai as genai
-import openai
-import anthropic
-import pandas as pd
+try:
+    import orjson
+except ImportError: # Fall back to the stdlib encoder where the orjson wheel isn't available
+    orjson = None
+import numpy as np
 
 # --- Configuration ---
 PLAYERS_FILE = 'players.json'
 PERSONALITIES_FILE = 'personalities.json'
-GAME_LOG_FILE = 'game_log.json'
+GAME_LOG_FILE = 'game_log.jsonl'
 RECORDS_DIR = 'game_records'
+LLM_CACHE_FILE = 'llm_cache.json'
+LLM_CACHE_SIZE = 4096
+# Output token caps. A structured decision is a few dozen tokens; statements are a short paragraph.
+DECISION_MAX_TOKENS = 100
+STATEMENT_MAX_TOKENS = 200
+# A multi-agent decision reply is a JSON array with one short entry per agent
+BATCH_DECISION_MAX_TOKENS_PER_AGENT = 32
+# Gemini models that think before answering count those tokens toward max_output_tokens,
+# so a cap sized for the answer alone can leave no text at all; they aren't capped.
+GEMINI_THINKING_MODEL_PREFIXES = ('gemini-2.5', 'gemini-3')
+# Rounds shown verbatim in LLM prompts; older rounds are condensed into per-player averages
+PROMPT_HISTORY_ROUNDS = 5
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,14 +43,120 @@ load_dotenv()
 GEMINI_API_KEY = os.environ.get("MY_GEMINI_API_KEY")
 OPENAI_API_KEY = os.environ.get("MY_OPENAI_API_KEY")
 ANTHROPIC_API_KEY = os.environ.get("MY_ANTHROPIC_API_KEY")
+# Replaying stored replies makes identical prompts deterministic, so this is opt-in.
+LLM_CACHE_ENABLED = os.environ.get("MY_LLM_CACHE") == "1"
+# One prompt per provider/model deciding for several agents at once. Every agent's strategy
+# then shares a single model context, which can blur their independence, so this is opt-in.
+BATCH_DECISIONS_ENABLED = os.environ.get("MY_LLM_BATCH_DECISIONS") == "1"
+# Lead every prompt in a round with the same history text (plain names, no "You" marker) so
+# providers can cache it as a prefix; each agent's name and strategy follow it. This moves
+# the agent's identity after the history, which changes what the model reads, so it's opt-in.
+PROMPT_CACHING_ENABLED = os.environ.get("MY_LLM_PROMPT_CACHING") == "1"
 
-if GEMINI_API_KEY:
+# --- Provider SDKs ---
+# The SDKs are slow to import, so each one is loaded (and configured) the first time an
+# LLMAgent needs it rather than when this module is imported.
+@functools.cache
+def _genai():
+    import google.generativeai as genai
     genai.configure(api_key=GEMINI_API_KEY)
+    return genai
+
+@functools.cache
+def _openai():
+    import openai
+    return openai
+
+@functools.cache
+def _anthropic():
+    import anthropic
+    return anthropic
+
+# One SDK client per provider, shared by every agent using it, so calls reuse one pooled
+# set of TCP+TLS connections. OpenAI/Anthropic pick the model per request; a Gemini
+# GenerativeModel is bound to its model, so Gemini gets one per model name. None of
+# them hold conversation state (every call sends the full prompt).
+@functools.lru_cache(maxsize=None)
+def _get_client(provider, model_name=None):
+    if provider == 'gemini':
+        return _genai().GenerativeModel(model_name)
+    if provider == 'openai':
+        return _openai().OpenAI(api_key=OPENAI_API_KEY)
+    if provider == 'anthropic':
+        return _anthropic().Anthropic(api_key=ANTHROPIC_API_KEY)
+    raise ValueError(f"Unsupported provider: {provider}.")
+
+# --- Prompt Templates ---
+DECISION_TASK = (
+    "Task: Based on the history and your strategy, decide how much to invest this round. Choose an INTEGER between 0 and 5.\n"
+    "Respond ONLY with your decision as JSON in the form {{\"investment\": <amount>, \"reason\": \"<one short sentence>\"}}."
+)
+STATEMENT_TASK = (
+    "Task: Make one statement to the group. Consider the game history shown, the discussions in it, and the most recent investment results. Do not repeat things you said in those discussions. Make your statement relevant to the current situation."
+)
+DECISION_PROMPT_TEMPLATE = (
+    "You are an AI player named {name}.\nYour strategy is: '{strategy}'\n\n"
+    "Here is the game history so far:\n{game_state_summary}\n\n" + DECISION_TASK
+)
+STATEMENT_PROMPT_TEMPLATE = (
+    "You are an AI player named {name}.\nYour strategy is: '{strategy}'\n\n"
+    "Here is the full context of the game so far:\n{discussion_context}\n\n" + STATEMENT_TASK
+)
+# With MY_LLM_PROMPT_CACHING=1: one shared prefix per round, then each agent's own suffix
+SHARED_DECISION_PREFIX_TEMPLATE = (
+    "You are an AI player in a multi-player investment game.\n\n"
+    "Here is the game history so far:\n{history}{payoff_rules}\n\n"
+)
+DECISION_SUFFIX_TEMPLATE = (
+    "--- Your Turn (Round {round_num}) ---\n"
+    "You are the AI player named {name}.\nYour strategy is: '{strategy}'\nYour Total Bank: {bank:.2f}\n\n" + DECISION_TASK
+)
+SHARED_STATEMENT_PREFIX_TEMPLATE = (
+    "You are an AI player in a multi-player investment game.\n\n"
+    "Here is the full context of the game so far:\n{history}\n{results}\n\n"
+)
+STATEMENT_SUFFIX_TEMPLATE = (
+    "You are the AI player named {name}.\nYour strategy is: '{strategy}'\n\n" + STATEMENT_TASK
+)
+BATCH_DECISION_PROMPT_TEMPLATE = (
+    "You are deciding this round's investments for {count} separate AI players in the same game. "
+    "Decide for each player independently, using only that player's own strategy and situation.\n\n"
+    "Here is the game history so far:\n{history}\n"
+    "--- Round {round_num} ---\n{payoff_rules}\n\n"
+    "{players}\n"
+    "Task: For each player, choose an INTEGER between 0 and 5 to invest this round.\n"
+    "Respond ONLY with a JSON array with one entry per player, in the form "
+    "[{{\"agent\": <player number>, \"investment\": <amount>}}, ...]."
+)
+BATCH_DECISION_PLAYER_TEMPLATE = (
+    "Player {index}: {name}\nTotal Bank: {bank:.2f}\nStrategy: '{strategy}'\n"
+)
+# Structured output for single-agent decisions, so replies parse on the first try.
+# Gemini's schema subset has no numeric bounds; replies are clamped to the limit anyway.
+DECISION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "investment": {"type": "integer", "minimum": 0, "maximum": 5},
+        "reason": {"type": "string"},
+    },
+    "required": ["investment"],
+}
+GEMINI_DECISION_SCHEMA = {
+    **DECISION_SCHEMA,
+    "properties": {"investment": {"type": "integer"}, "reason": {"type": "string"}},
+}
+PAYOFF_RULES_TEMPLATE = (
+    "Payoff Rules: Invest an integer from 0 to {investment_limit}. You keep what you don't invest. "
+    "The common pot is multiplied by {multiplier} and shared equally."
+)
 
 # --- Player and Agent Classes ---
 # ... existing Player and LLMAgent class code ...
 class Player:
+    __slots__ = ('player_id', 'name', 'player_type', 'bank', '_personality', '_strategy', 'history', '_static_dict')
+
     def __init__(self, name, player_type="human", bank=100.0, personality="N/A", strategy="N/A", history=None, player_id=None):
+        self._static_dict = None
         self.player_id = player_id if player_id is not None else str(uuid.uuid4())
         self.name = name
         self.player_type = player_type
@@ -38,12 +165,37 @@ class Player:
         self.strategy = strategy
         self.history = history if history is not None else []
 
-    def to_dict(self):
+    # personality and strategy feed the cached to_dict fields, so changing them drops the cache
+    @property
+    def personality(self):
+        return self._personality
+
+    @personality.setter
+    def personality(self, value):
+        self._personality = value
+        self._static_dict = None
+
+    @property
+    def strategy(self):
+        return self._strategy
+
+    @strategy.setter
+    def strategy(self, value):
+        self._strategy = value
+        self._static_dict = None
+
+    def _static_fields(self):
+        # 'bank' is a placeholder that keeps the key's position; to_dict fills it in
         return {
             'player_id': self.player_id, 'name': self.name, 'player_type': self.player_type,
-            'bank': self.bank, 'personality': self.personality, 'strategy': self.strategy,
+            'bank': None, 'personality': self.personality, 'strategy': self.strategy,
         }
 
+    def to_dict(self):
+        if self._static_dict is None:
+            self._static_dict = self._static_fields()
+        return {**self._static_dict, 'bank': self.bank}
+
     @classmethod
     def from_dict(cls, data):
         data_copy = data.copy()
@@ -56,6 +208,8 @@ class Player:
         return f"Player(Name: {self.name}, Type: {self.player_type}, Bank: {self.bank:.2f})"
 
 class LLMAgent(Player):
+    __slots__ = ('provider', 'model_name', 'client')
+
     def __init__(self, name, player_type, bank, personality, strategy, history=None, player_id=None, provider='gemini', model=None):
         super().__init__(name, player_type, bank, personality, strategy, history, player_id)
         self.provider = provider.lower()
@@ -67,21 +221,21 @@ class LLMAgent(Player):
         if self.provider == 'gemini':
             if not GEMINI_API_KEY: raise ValueError("Gemini API key is not configured.")
             self.model_name = self.model_name or 'gemini-2.5-pro-latest'
-            self.client = genai.GenerativeModel(self.model_name)
+            self.client = _get_client('gemini', self.model_name)
         elif self.provider == 'openai':
             if not OPENAI_API_KEY: raise ValueError("OpenAI API key is not configured.")
             self.model_name = self.model_name or 'gpt-4o'
-            self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
+            self.client = _get_client('openai')
         elif self.provider == 'anthropic':
             if not ANTHROPIC_API_KEY: raise ValueError("Anthropic API key is not configured.")
             self.model_name = self.model_name or 'claude-3-opus-20240229'
-            self.client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+            self.client = _get_client('anthropic')
         else:
             raise ValueError(f"Unsupported provider: {self.provider}.")
         print(f"LLMAgent {self.name} initialized with provider: {self.provider.upper()} using model: {self.model_name}")
     
-    def to_dict(self):
-        data = super().to_dict()
+    def _static_fields(self):
+        data = super()._static_fields()
         data['provider'] = self.provider
         data['model'] = self.model_name
         return data
@@ -94,85 +248,303 @@ class LLMAgent(Player):
             player_id=data.get('player_id'), provider=data.get('provider', 'gemini'), model=data.get('model')
         )
 
-    def _call_llm_api(self, prompt):
-        """Internal method to call the appropriate LLM API."""
+    def _call_llm_api(self, prompt, decision=False, max_tokens=None, prefix=None):
+        """
+        Internal method to call the appropriate LLM API. With decision=True the provider is
+        made to answer in DECISION_SCHEMA form, and the reply comes back as its JSON text.
+        Output is capped at max_tokens, by default DECISION_MAX_TOKENS or STATEMENT_MAX_TOKENS
+        (except on Gemini thinking models, see GEMINI_THINKING_MODEL_PREFIXES).
+        A prefix shared with other agents' prompts is sent first, marked cacheable where the
+        provider needs that spelled out.
+        """
+        if max_tokens is None:
+            max_tokens = DECISION_MAX_TOKENS if decision else STATEMENT_MAX_TOKENS
+        text = prompt if prefix is None else prefix + prompt
         if self.provider == 'gemini':
-            return self.client.generate_content(prompt).text
+            generation_config = {}
+            if not self.model_name.startswith(GEMINI_THINKING_MODEL_PREFIXES):
+                generation_config["max_output_tokens"] = max_tokens
+            if decision:
+                generation_config.update(response_mime_type="application/json", response_schema=GEMINI_DECISION_SCHEMA)
+            return self.client.generate_content(text, generation_config=generation_config).text
         elif self.provider == 'openai':
+            extra = {"response_format": {
+                "type": "json_schema", "json_schema": {"name": "decision", "schema": DECISION_SCHEMA}
+            }} if decision else {}
             response = self.client.chat.completions.create(
                 model=self.model_name,
-                messages=[{"role": "user", "content": prompt}]
+                max_completion_tokens=max_tokens,
+                # OpenAI caches long repeated prompt prefixes automatically
+                messages=[{"role": "user", "content": text}],
+                **extra
             )
             return response.choices[0].message.content
         elif self.provider == 'anthropic':
+            # Anthropic has no JSON response mode; forcing a single tool call gets the same result
+            extra = {
+                "tools": [{
+                    "name": "submit_decision", "description": "Submit your investment for this round.",
+                    "input_schema": DECISION_SCHEMA
+                }],
+                "tool_choice": {"type": "tool", "name": "submit_decision"},
+            } if decision else {}
+            content = prompt if prefix is None else [
+                {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": prompt},
+            ]
             response = self.client.messages.create(
                 model=self.model_name,
-                max_tokens=200,
-                messages=[{"role": "user", "content": prompt}]
+                max_tokens=max_tokens,
+                messages=[{"role": "user", "content": content}],
+                **extra
             )
+            if decision:
+                # A refusal or a reply cut off before the tool call has no tool_use block. Raise an
+                # ordinary error: a StopIteration from next() can't cross asyncio.to_thread.
+                tool_use = next((block for block in response.content if block.type == "tool_use"), None)
+                if tool_use is None:
+                    raise ValueError(f"No submit_decision call in the reply (stop reason: {response.stop_reason}).")
+                return dumps_json(tool_use.input).decode()
             return response.content[0].text
         return ""
 
-    def make_decision(self, game_state_summary):
-        full_prompt = (
-            f"You are an AI player named {self.name}.\nYour strategy is: '{self.strategy}'\n\n"
-            f"Here is the game history so far:\n{game_state_summary}\n\n"
-            f"Task: Based on the history and your strategy, decide how much to invest this round. Choose an INTEGER between 0 and 5.\n"
-            f"Respond ONLY with your decision in the format 'INVESTMENT: <amount>'."
+    def _decision_prompt(self, game_state_summary):
+        return DECISION_PROMPT_TEMPLATE.format(
+            name=self.name, strategy=self.strategy, game_state_summary=game_state_summary
         )
-        print(f"\n--- LLMAgent {self.name} ({self.provider.upper()}/{self.model_name}) Deciding Investment ---")
-        try:
-            response_text = self._call_llm_api(full_prompt).strip()
-            print(f"LLM Response for {self.name}: {response_text}")
-            decision = 0
-            if response_text.upper().startswith("INVESTMENT:"):
-                choice_str = response_text.upper().replace("INVESTMENT:", "").strip()
-                decision = max(0, min(5, int(float(choice_str))))
-            return decision, response_text
-        except Exception as e:
-            print(f"Error calling {self.provider.upper()} API for player {self.name}: {e}")
-            return 0, f"API Error: {e}"
-
-    def make_statement(self, discussion_context):
-        full_prompt = (
-            f"You are an AI player named {self.name}.\nYour strategy is: '{self.strategy}'\n\n"
-            f"Here is the full context of the game so far:\n{discussion_context}\n\n"
-            f"Task: Make one statement to the group. Consider the entire game history, previous discussions, and the most recent investment results. Do not repeat things you have said before. Make your statement relevant to the current situation."
+
+    def _decision_suffix(self, round_num):
+        """This agent's part of a decision prompt that follows a shared prefix."""
+        return DECISION_SUFFIX_TEMPLATE.format(
+            round_num=round_num, name=self.name, strategy=self.strategy, bank=self.bank
         )
+
+    def _call_llm_api_cached(self, prompt, decision=False, prefix=None, max_tokens=None):
+        """Like _call_llm_api, but replays the stored reply for a prompt seen before (if enabled)."""
+        if not LLM_CACHE_ENABLED: return self._call_llm_api(prompt, decision, max_tokens, prefix)
+        full_prompt = prompt if prefix is None else prefix + prompt
+        key = hashlib.blake2b(
+            "\0".join((self.provider, self.model_name, self.personality, self.strategy, full_prompt)).encode(),
+            digest_size=16
+        ).hexdigest()
+        with _llm_cache_lock:
+            if key in _llm_cache:
+                _llm_cache.move_to_end(key)
+                return _llm_cache[key]
+        response_text = self._call_llm_api(prompt, decision, max_tokens, prefix)
+        if not response_text: return response_text # An empty reply isn't worth replaying
+        with _llm_cache_lock:
+            _llm_cache[key] = response_text
+            if len(_llm_cache) > LLM_CACHE_SIZE: _llm_cache.popitem(last=False)
+        return response_text
+
+    def make_statement(self, discussion_context, prefix=None):
+        """
+        Asks for one statement to the group. Given a shared prefix that already holds the
+        game context, discussion_context is ignored and only this agent's part follows it.
+        """
+        if prefix is None:
+            full_prompt = STATEMENT_PROMPT_TEMPLATE.format(
+                name=self.name, strategy=self.strategy, discussion_context=discussion_context
+            )
+        else:
+            full_prompt = STATEMENT_SUFFIX_TEMPLATE.format(name=self.name, strategy=self.strategy)
         print(f"\n--- LLMAgent {self.name} ({self.provider.upper()}/{self.model_name}) Making Statement ---")
         try:
-            return self._call_llm_api(full_prompt).strip()
+            return self._call_llm_api(full_prompt, prefix=prefix).strip()
         except Exception as e:
             print(f"Error calling {self.provider.upper()} API for statement from {self.name}: {e}")
             return "..."
 
+    @staticmethod
+    def batch_decide(agents, history, round_num, payoff_rules, investment_limit=5):
+        """
+        Asks one model for the investments of several agents sharing a provider and model.
+        Returns [(decision, explanation), ...] in agent order, or None if the call fails or
+        the reply doesn't cover every agent, so the caller can fall back to single prompts.
+        """
+        players = "".join(
+            BATCH_DECISION_PLAYER_TEMPLATE.format(index=i, name=a.name, bank=a.bank, strategy=a.strategy)
+            for i, a in enumerate(agents)
+        )
+        prompt = BATCH_DECISION_PROMPT_TEMPLATE.format(
+            count=len(agents), history=history, round_num=round_num, payoff_rules=payoff_rules, players=players
+        )
+        lead = agents[0]
+        print(f"\n--- LLMAgent batch ({lead.provider.upper()}/{lead.model_name}) Deciding {len(agents)} Investments ---")
+        try:
+            max_tokens = BATCH_DECISION_MAX_TOKENS_PER_AGENT * (len(agents) + 1)
+            response_text = lead._call_llm_api_cached(prompt, max_tokens=max_tokens).strip()
+            print(f"LLM Response for batch: {response_text}")
+            entries = loads_json(response_text[response_text.index('['):response_text.rindex(']') + 1])
+            by_index = {int(e['agent']): e for e in entries}
+            return [
+                (max(0, min(investment_limit, int(float(by_index[i]['investment'])))),
+                 f"Batched decision: {dumps_json(by_index[i]).decode()}")
+                for i in range(len(agents))
+            ]
+        except Exception as e:
+            print(f"Batched decision for {len(agents)} {lead.provider.upper()} agents failed, using single prompts: {e}")
+            return None
+
+    async def amake_statement(self, discussion_context, prefix=None):
+        """Async variant of make_statement; runs the blocking API call in a worker thread."""
+        return await asyncio.to_thread(self.make_statement, discussion_context, prefix)
+
+# Matches "INVESTMENT: 3" on any line, tolerating leading whitespace and markdown (e.g. "**INVESTMENT:** 3"),
+# or the "investment": 3 field of a JSON reply that was cut off at the token cap. A number with
+# an exponent (1e400) doesn't match at all, rather than being read as its mantissa.
+_INVESTMENT_RE = re.compile(
+    r'(?im)(?:^[\s*_#>`-]*INVESTMENT[\s*_]*:[\s*_]*|"investment"\s*:\s*)([-+]?\d+(?:\.\d+)?)(?!\d|\.\d|[eE][-+]?\d)'
+)
+
+def _parse_investment_response(response_text, investment_limit=5):
+    """
+    Parses a structured {"investment": <amount>} reply into a clamped integer. Free-text
+    'INVESTMENT: <amount>' replies (e.g. cached from older prompts) are still understood;
+    anything else, including amounts too large for a float, counts as 0.
+    """
+    if response_text.startswith('{'):
+        try:
+            return max(0, min(investment_limit, int(float(loads_json(response_text)['investment']))))
+        except OverflowError:
+            return 0
+        except (ValueError, TypeError, KeyError):
+            pass
+    match = _INVESTMENT_RE.search(response_text)
+    if not match: return 0
+    try: return max(0, min(investment_limit, int(float(match.group(1)))))
+    except OverflowError: return 0
+
+async def batch_generate(agent_prompts, decision=False, prefix=None):
+    """
+    Sends a batch of (agent, prompt) pairs in one concurrent fan-out and returns the
+    response texts in the same order. Failed calls come back as 'API Error: ...' text.
+    decision=True asks for structured investment replies, and a prefix is sent ahead of
+    every prompt (see LLMAgent._call_llm_api).
+    """
+    responses = await asyncio.gather(
+        *(asyncio.to_thread(agent._call_llm_api_cached, prompt, decision, prefix) for agent, prompt in agent_prompts),
+        return_exceptions=True
+    )
+    # Providers can answer with no text at all (e.g. an OpenAI refusal has content None)
+    return [f"API Error: {r}" if isinstance(r, Exception) else (r or "").strip() for r in responses]
+
 # --- Data Management Functions ---
-def load_json_data(filename):
-    if not os.path.exists(filename): return []
-    with open(filename, 'r') as f:
-        try: return json.load(f)
-        except json.JSONDecodeError: return []
-def save_json_data(data, filename):
-    with open(filename, 'w') as f: json.dump(data, f, indent=2)
+def dumps_json(data, indent=False):
+    """Serializes data to UTF-8 JSON bytes, pretty-printed with 2-space indents if asked."""
+    if orjson: return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(data, indent=2 if indent else None, ensure_ascii=False).encode()
+def loads_json(raw):
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch the latter
+    return orjson.loads(raw) if orjson else json.loads(raw)
+# Parsed JSON files keyed by path -> ((mtime_ns, size), data). Callers must treat the
+# returned data as read-only; it is shared between requests until the file changes.
+_json_cache = {}
+
+def load_json_data(filename, strict=False):
+    """Returns a JSON file's data, or [] if it's missing or (unless strict) unparseable."""
+    try: st = os.stat(filename)
+    except FileNotFoundError: return []
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _json_cache.get(filename)
+    if cached and cached[0] == stamp: return cached[1]
+    with open(filename, 'rb') as f:
+        try: data = loads_json(f.read())
+        except json.JSONDecodeError:
+            if strict: raise
+            return []
+    _json_cache[filename] = (stamp, data)
+    return data
+def save_json_data(data, filename, indent=True):
+    # Written to a private temp file and swapped in whole, so readers in other threads or
+    # server processes see either the old file or the new one, never a partial write
+    tmp_path = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f: f.write(dumps_json(data, indent))
+    os.replace(tmp_path, filename)
 def save_players(players_list):
     save_json_data([p.to_dict() for p in players_list], PLAYERS_FILE)
-def load_players():
-    return [Player.from_dict(p_data) for p_data in load_json_data(PLAYERS_FILE)]
+def load_players(strict=False):
+    return [Player.from_dict(p_data) for p_data in load_json_data(PLAYERS_FILE, strict)]
 def append_to_game_log(new_entries):
-    log_data = load_json_data(GAME_LOG_FILE)
-    log_data.extend(new_entries)
-    save_json_data(log_data, GAME_LOG_FILE)
-def save_game_to_csv(game_log, game_id, timestamp):
-    if not game_log: return
-    if not os.path.exists(RECORDS_DIR): os.makedirs(RECORDS_DIR)
-    df = pd.DataFrame(game_log)
+    # JSON Lines, appended in a single write so each round costs O(new entries)
+    with open(GAME_LOG_FILE, 'ab') as f:
+        f.write(b"".join(dumps_json(entry) + b"\n" for entry in new_entries))
+def load_game_log():
+    """Yields every logged entry, oldest first."""
+    if not os.path.exists(GAME_LOG_FILE): return
+    with open(GAME_LOG_FILE, 'rb') as f:
+        for line in f:
+            if line.strip(): yield loads_json(line)
+# Columns of a game record CSV, in the order of the round log entries
+RECORD_FIELDS = ['game_id', 'round', 'player_id', 'player_name', 'player_type', 'decision', 'payoff', 'contribution', 'statement', 'thinking']
+
+def game_record_path(game_id, timestamp):
     # --- CHANGE: Use timestamp in the filename ---
-    filepath = os.path.join(RECORDS_DIR, f"game-record_{timestamp}_{game_id}.csv")
-    df.to_csv(filepath, index=False)
-    print(f"Game record saved to {filepath}")
+    return os.path.join(RECORDS_DIR, f"game-record_{timestamp}_{game_id}.csv")
+
+def append_to_game_record(round_log_entries, game_id, timestamp):
+    """Appends one round's log entries to the game's CSV record, writing the header first if it's new."""
+    if not round_log_entries: return
+    os.makedirs(RECORDS_DIR, exist_ok=True)
+    filepath = game_record_path(game_id, timestamp)
+    with open(filepath, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=RECORD_FIELDS, lineterminator='\n')
+        if f.tell() == 0: writer.writeheader()
+        writer.writerows(round_log_entries)
+    if _record_index is not None: _record_index[game_id] = os.path.basename(filepath)
+
+# game_id -> CSV filename in RECORDS_DIR. Built by one directory scan on first use and
+# kept current by append_to_game_record, so downloads don't list the directory every time.
+_record_index = None
+
+def _scan_records():
+    index = {}
+    with os.scandir(RECORDS_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith('.csv'):
+                # Both "game-record_<timestamp>_<game_id>.csv" and older "<game_id>.csv" names
+                index[entry.name[:-len('.csv')].rsplit('_', 1)[-1]] = entry.name
+    return index
+
+def find_game_record(game_id):
+    """Returns the CSV filename in RECORDS_DIR for a game, or None if there isn't one."""
+    global _record_index
+    if _record_index is None or game_id not in _record_index:
+        # Cold start, or the record was written by another worker process
+        try: _record_index = _scan_records()
+        except FileNotFoundError: return None
+    return _record_index.get(game_id)
+
+# --- LLM Response Cache ---
+# Decision replies keyed by a hash of (provider, model, personality, strategy, prompt),
+# oldest first. Persisted to LLM_CACHE_FILE between runs when MY_LLM_CACHE=1.
+_llm_cache = OrderedDict()
+_llm_cache_lock = threading.Lock()
+
+def _save_llm_cache():
+    # Every server process saves at exit; save_json_data swaps the file in whole, so the
+    # last process to exit wins rather than overlapping writes corrupting it
+    with _llm_cache_lock:
+        save_json_data(list(_llm_cache.items()), LLM_CACHE_FILE)
+
+if LLM_CACHE_ENABLED:
+    _llm_cache.update((key, text) for key, text in load_json_data(LLM_CACHE_FILE)[-LLM_CACHE_SIZE:] if text)
+    atexit.register(_save_llm_cache)
 
 # --- Game Class ---
+# Cached prompt text marks player names as \0I<player_id>\0 (rendered "You (Name)" for the
+# reader, as in investment lines) or \0S<player_id>\0 (rendered "You", as in discussion lines).
+_NAME_SENTINEL_RE = re.compile("\0([IS])([^\0]*)\0")
+
 class Game:
+    __slots__ = (
+        'game_id', 'timestamp', 'num_rounds', 'multiplier', 'current_round', 'investment_limit',
+        '_payoff_rules', 'players', 'current_game_log', 'game_earnings', 'last_discussion',
+        'last_investment_results', 'phase', '_round_summary_cache', '_running_totals', '_history_cache', '_results_cache',
+        '_human_player', '_player_ids'
+    )
+
     def __init__(self, game_id, participating_players, num_rounds=10, multiplier=1.5, timestamp=None):
         self.game_id = game_id
         # --- CHANGE: Store a timestamp for the game ---
@@ -181,12 +553,26 @@ class Game:
         self.multiplier = multiplier
         self.current_round = 0
         self.investment_limit = 5
-        self.players = participating_players
+        self._payoff_rules = PAYOFF_RULES_TEMPLATE.format(
+            investment_limit=self.investment_limit, multiplier=self.multiplier
+        )
+        self.players = []
+        self._player_ids = set()
+        # The roster is fixed once play starts, so the human seat is found as players join
+        self._human_player = None
+        self.game_earnings = {}
+        for player in participating_players:
+            self.add_player(player)
         self.current_game_log = []
-        self.game_earnings = {p.player_id: 0.0 for p in self.players}
         self.last_discussion = {}
         self.last_investment_results = {}
         self.phase = "INVESTMENT"
+        # Rendered history text per round, filled in as rounds are logged
+        self._round_summary_cache = {}
+        # round -> {player_id: (total invested, total earned)} up to and including that round
+        self._running_totals = {}
+        self._history_cache = None
+        self._results_cache = None
 
     def to_dict(self):
         return {
@@ -207,32 +593,99 @@ class Game:
         )
         game.current_round = data['current_round']
         game.current_game_log = data['current_game_log']
+        game._rebuild_round_caches()
         game.game_earnings = data['game_earnings']
         game.last_discussion = data.get('last_discussion', {})
         game.last_investment_results = data.get('last_investment_results', {})
         game.phase = data.get('phase', 'INVESTMENT')
         return game
+    def add_player(self, player):
+        """
+        Adds a player before the first round. Returns False, leaving the roster unchanged,
+        if a player with the same player_id has already joined.
+        """
+        if self.current_round: raise ValueError("Players can only join before the first round.")
+        if player.player_id in self._player_ids: return False
+        self._player_ids.add(player.player_id)
+        self.players.append(player)
+        self.game_earnings[player.player_id] = 0.0
+        if self._human_player is None and player.name.startswith('Human_'):
+            self._human_player = player
+        return True
+
 # ... existing get_human_player, process_investment_round, process_discussion_round methods ...
     def get_human_player(self):
-        return next((p for p in self.players if p.name.startswith('Human_')), None)
+        return self._human_player
+
+    def _llm_agents(self):
+        """Returns the LLM-driven players that act on their own each phase."""
+        human_pid = self._human_player and self._human_player.player_id
+        return [p for p in self.players if isinstance(p, LLMAgent) and p.player_id != human_pid]
 
     def process_investment_round(self, human_decision=None):
+        """Blocking entry point for request handlers; the agents are still queried concurrently."""
+        asyncio.run(self.aprocess_investment_round(human_decision))
+
+    async def aprocess_investment_round(self, human_decision=None):
+        """Queries all LLM agents for their investments concurrently, then applies the results."""
         self.current_round += 1
+        agents = self._llm_agents()
+        agent_results = await self._batch_decisions(agents) if BATCH_DECISIONS_ENABLED else {}
+        pending = [agent for agent in agents if agent.player_id not in agent_results]
+        if PROMPT_CACHING_ENABLED:
+            prefix = SHARED_DECISION_PREFIX_TEMPLATE.format(
+                history=self._named(self._history_skeleton()), payoff_rules=self._payoff_rules
+            )
+            agent_prompts = [(agent, agent._decision_suffix(self.current_round)) for agent in pending]
+        else:
+            prefix = None
+            agent_prompts = [
+                (agent, agent._decision_prompt(self._create_game_state_summary(agent))) for agent in pending
+            ]
+        if agent_prompts:
+            print(f"\n--- Querying {len(agent_prompts)} agents concurrently for investment decisions ---")
+        responses = await batch_generate(agent_prompts, decision=True, prefix=prefix)
+        for (agent, _), response_text in zip(agent_prompts, responses):
+            print(f"LLM Response for {agent.name}: {response_text}")
+            agent_results[agent.player_id] = (
+                _parse_investment_response(response_text, self.investment_limit), response_text
+            )
+        self._apply_investment_results(agent_results, human_decision)
+
+    async def _batch_decisions(self, agents):
+        """Gets decisions with one multi-agent prompt per provider/model group of 2+ agents."""
+        groups = {}
+        for agent in agents:
+            groups.setdefault((agent.provider, agent.model_name), []).append(agent)
+        groups = [group for group in groups.values() if len(group) > 1]
+        history = self._named(self._history_skeleton())
+        results = await asyncio.gather(*(
+            asyncio.to_thread(
+                LLMAgent.batch_decide, group, history, self.current_round, self._payoff_rules, self.investment_limit
+            )
+            for group in groups
+        ))
+        agent_results = {}
+        for group, decisions in zip(groups, results):
+            if decisions:
+                agent_results.update((agent.player_id, d) for agent, d in zip(group, decisions))
+        return agent_results
+
+    def _apply_investment_results(self, agent_results, human_decision=None):
+        """Fills in decisions for every player, computes payoffs and moves to discussion."""
         decisions = {}
         explanations = {}
-        human_player = self.get_human_player()
+        human_pid = self._human_player and self._human_player.player_id
 
         for player in self.players:
-            if human_player and player.player_id == human_player.player_id: continue
-            if isinstance(player, LLMAgent):
-                summary = self._create_game_state_summary(player)
-                decision, explanation = player.make_decision(summary)
-                decisions[player.player_id], explanations[player.player_id] = decision, explanation
+            if player.player_id == human_pid: continue
+            if player.player_id in agent_results:
+                decisions[player.player_id], explanations[player.player_id] = agent_results[player.player_id]
             else:
                 decisions[player.player_id], explanations[player.player_id] = 0, "Default NPC behavior"
 
-        if human_player and human_decision is not None:
-            decisions[human_player.player_id], explanations[human_player.player_id] = human_decision, "Human decision"
+        if human_pid and human_decision is not None:
+            decisions[human_pid], explanations[human_pid] = human_decision, "Human decision"
         
         payoffs = self._calculate_payoffs(decisions)
         self.last_investment_results = {"decisions": decisions, "payoffs": payoffs, "explanations": explanations}
@@ -240,16 +693,35 @@ class Game:
         self.phase = "DISCUSSION"
 
     def process_discussion_round(self, human_statement=None):
+        """Blocking entry point for request handlers; the agents are still queried concurrently."""
+        asyncio.run(self.aprocess_discussion_round(human_statement))
+
+    async def aprocess_discussion_round(self, human_statement=None):
+        """Queries all LLM agents for their statements concurrently, then logs the round."""
+        agents = [player for player in self.players if isinstance(player, LLMAgent)]
+        if PROMPT_CACHING_ENABLED:
+            prefix = SHARED_STATEMENT_PREFIX_TEMPLATE.format(
+                history=self._named(self._history_skeleton()), results=self._named(self._results_skeleton())
+            )
+            statements = (agent.amake_statement(None, prefix) for agent in agents)
+        else:
+            statements = (agent.amake_statement(self._create_context_for_statement(agent)) for agent in agents)
+        results = await asyncio.gather(*statements)
+        self._apply_discussion_results(
+            {agent.player_id: result for agent, result in zip(agents, results)}, human_statement
+        )
+
+    def _apply_discussion_results(self, agent_statements, human_statement=None):
+        """Collects the round's statements, logs the round and advances the game phase."""
         statements = {}
-        human_player = self.get_human_player()
-        if human_player and human_statement is not None:
-            statements[human_player.player_id] = human_statement
+        human_pid = self._human_player and self._human_player.player_id
+        if human_pid and human_statement is not None:
+            statements[human_pid] = human_statement
 
         for player in self.players:
-            if isinstance(player, LLMAgent):
-                discussion_context = self._create_context_for_statement(player)
-                statements[player.player_id] = player.make_statement(discussion_context)
-            elif player.player_type == 'human' and player.player_id != (human_player and human_player.player_id):
+            if player.player_id in agent_statements:
+                statements[player.player_id] = agent_statements[player.player_id]
+            elif player.player_type == 'human' and player.player_id != human_pid:
                  statements[player.player_id] = "..."
         
         self.last_discussion = statements
@@ -258,8 +730,8 @@ class Game:
 
         if self.current_round >= self.num_rounds:
             self.phase = "GAMEOVER"
-            # --- CHANGE: Pass timestamp to the save function ---
-            save_game_to_csv(self.current_game_log, self.game_id, self.timestamp)
+            # Rows were appended to the record as each round was logged
+            print(f"Game record saved to {game_record_path(self.game_id, self.timestamp)}")
         else:
             self.phase = "INVESTMENT"
 
@@ -268,95 +740,197 @@ class Game:
         decisions = self.last_investment_results.get('decisions', {})
         payoffs = self.last_investment_results.get('payoffs', {})
         explanations = self.last_investment_results.get('explanations', {})
-        avg_inv = sum(decisions.values()) / len(decisions) if decisions else 0
+        avg_inv = np.mean(list(decisions.values())) if decisions else 0
+
+        # Per-player columns in roster order. Payoffs are rounded with round(), as before: np.round
+        # scales by 100 first and disagrees with it on values near a half (e.g. 5.675)
+        n = len(self.players)
+        round_decisions = [decisions.get(p.player_id, 0) for p in self.players]
+        decision_arr = np.array(round_decisions, dtype=np.float64)
+        payoff_arr = np.fromiter((payoffs.get(p.player_id, 0) for p in self.players), dtype=np.float64, count=n)
+        contributions = np.where(decision_arr > avg_inv, 'more', np.where(decision_arr < avg_inv, 'less', 'same')).tolist()
+        round_payoffs = payoff_arr.tolist()
+        rounded_payoffs = [round(payoff, 2) for payoff in round_payoffs]
+        banks = np.fromiter((p.bank for p in self.players), dtype=np.float64, count=n)
+        np.add(banks, payoff_arr, out=banks)
 
         round_log_entries = []
-        for player in self.players:
-            payoff = payoffs.get(player.player_id, 0)
-            decision = decisions.get(player.player_id, 0)
-            player.bank += payoff
+        for player, decision, payoff, rounded, contribution, bank in zip(
+            self.players, round_decisions, round_payoffs, rounded_payoffs, contributions, banks.tolist()
+        ):
+            player.bank = bank
             self.game_earnings[player.player_id] += payoff
-            
-            log_entry = {
+            round_log_entries.append({
                 'game_id': self.game_id, 'round': self.current_round, 'player_id': player.player_id,
                 'player_name': player.name, 'player_type': player.personality if isinstance(player, LLMAgent) else player.player_type,
-                'decision': decision, 'payoff': round(payoff, 2),
-                'contribution': 'more' if decision > avg_inv else ('less' if decision < avg_inv else 'same'),
+                'decision': decision, 'payoff': rounded, 'contribution': contribution,
                 'statement': statements.get(player.player_id, "N/A"),
                 'thinking': explanations.get(player.player_id, "N/A")
-            }
-            round_log_entries.append(log_entry)
-        
+            })
+
         self.current_game_log.extend(round_log_entries)
+        self._round_summary_cache[self.current_round] = self._render_round_summary(self.current_round, round_log_entries)
+        self._add_running_totals(self.current_round, round_log_entries)
         append_to_game_log(round_log_entries)
+        append_to_game_record(round_log_entries, self.game_id, self.timestamp)
 
     def _create_context_for_statement(self, current_player):
         history_summary = self._create_game_state_summary(current_player, for_statement=True)
-        
+        results_summary = self._personalize(self._results_skeleton(), current_player)
+        return f"{history_summary}\n{results_summary}"
+
+    def _results_skeleton(self):
+        """The latest investment results shared by every statement prompt, with name sentinels."""
+        if self._results_cache and self._results_cache[0] == self.current_round:
+            return self._results_cache[1]
+
         if not self.last_investment_results:
-            results_summary = "This is the first round, so there are no investment results to discuss yet."
+            text = "This is the first round, so there are no investment results to discuss yet."
         else:
-            results_summary = f"--- Results of Investment Round {self.current_round} ---\n"
             decisions = self.last_investment_results.get('decisions', {})
             payoffs = self.last_investment_results.get('payoffs', {})
-            for p in self.players:
-                p_name = f"You ({p.name})" if p.player_id == current_player.player_id else p.name
-                results_summary += f"- {p_name} invested {decisions.get(p.player_id, 0)}, earning a payoff of {payoffs.get(p.player_id, 0):.2f}.\n"
-        return f"{history_summary}\n{results_summary}"
+            parts = [f"--- Results of Investment Round {self.current_round} ---\n"]
+            parts.extend(
+                f"- \0I{p.player_id}\0 invested {decisions.get(p.player_id, 0)}, "
+                f"earning a payoff of {payoffs.get(p.player_id, 0):.2f}.\n"
+                for p in self.players
+            )
+            text = "".join(parts)
+        self._results_cache = (self.current_round, text)
+        return text
 
     def _create_game_state_summary(self, current_player, for_statement=False):
-        summary = f"--- Full Game History (Newest to Oldest) ---\n\n"
+        parts = [self._personalize(self._history_skeleton(), current_player)]
+        if not for_statement:
+            # Decisions are requested after current_round has moved on to the round being played
+            parts.append(f"--- Your Turn (Round {self.current_round}) ---\n")
+            parts.append(f"Your Total Bank: {current_player.bank:.2f}\n")
+            parts.append(self._payoff_rules)
+        return "".join(parts)
+
+    def _personalize(self, text, current_player):
+        """Replaces the name sentinels in shared prompt text with names as current_player sees them."""
+        names = {p.player_id: p.name for p in self.players}
+        def name_for(match):
+            kind, player_id = match.groups()
+            if player_id != current_player.player_id: return names.get(player_id, match.group(0))
+            return f"You ({current_player.name})" if kind == 'I' else "You"
+        return _NAME_SENTINEL_RE.sub(name_for, text)
+
+    def _named(self, text):
+        """Replaces the name sentinels in shared prompt text with plain player names."""
+        names = {p.player_id: p.name for p in self.players}
+        return _NAME_SENTINEL_RE.sub(lambda m: names.get(m.group(2), m.group(0)), text)
+
+    def _history_skeleton(self):
+        """
+        The game history shared by every player's prompt, with name sentinels in place of
+        player names. Rebuilt only when a new round has been logged.
+        """
+        if self._history_cache and self._history_cache[0] == len(self.current_game_log):
+            return self._history_cache[1]
+
+        # --- CHANGE: Display rounds in descending order ---
+        round_nums = sorted(self._round_summary_cache, reverse=True)
+        if len(round_nums) > PROMPT_HISTORY_ROUNDS:
+            # Older rounds lose their discussion, so don't call this the full history
+            parts = [f"--- Game History (Newest to Oldest; last {PROMPT_HISTORY_ROUNDS} rounds in full, earlier rounds condensed) ---\n\n"]
+        else:
+            parts = ["--- Full Game History (Newest to Oldest) ---\n\n"]
+        parts.extend(self._round_summary_cache[r] for r in round_nums[:PROMPT_HISTORY_ROUNDS])
+        older_rounds = round_nums[PROMPT_HISTORY_ROUNDS:]
+        if older_rounds:
+            parts.append(self._condensed_history(older_rounds[-1], older_rounds[0]))
+
+        self._history_cache = (len(self.current_game_log), "".join(parts))
+        return self._history_cache[1]
+
+    @staticmethod
+    def _render_round_summary(round_num, round_actions):
+        """Renders one round's investments and discussion, with name sentinels."""
+        parts = [f"**Round {round_num} Summary:**\n"]
+        for action in round_actions:
+            parts.append(
+                f"- \0I{action['player_id']}\0 invested {action['decision']} "
+                f"({action['contribution']} than avg), payoff was {action['payoff']:.2f}.\n"
+            )
+
+        discussion_summary = []
+        parts.append(f"[Discussion after Round {round_num}]\n")
+        for action in round_actions:
+            if action['statement'] and action['statement'] != "N/A":
+                # Statements are free text; drop any \0 so they can't forge a name sentinel
+                statement = action['statement'].replace("\0", "")
+                discussion_summary.append(f"- \0S{action['player_id']}\0 said: {statement}\n")
+        if discussion_summary:
+            parts.extend(discussion_summary)
+        else:
+            parts.append("- No discussion took place.\n")
+        parts.append("\n")
+        return "".join(parts)
+
+    def _rebuild_round_caches(self):
         rounds_data = {}
         for log_entry in self.current_game_log:
-            round_num = log_entry['round']
-            if round_num not in rounds_data:
-                rounds_data[round_num] = []
-            rounds_data[round_num].append(log_entry)
+            rounds_data.setdefault(log_entry['round'], []).append(log_entry)
+        self._round_summary_cache = {}
+        self._running_totals = {}
+        for round_num in sorted(rounds_data):
+            self._round_summary_cache[round_num] = self._render_round_summary(round_num, rounds_data[round_num])
+            self._add_running_totals(round_num, rounds_data[round_num])
 
-        # --- CHANGE: Display rounds in descending order ---
-        for round_num in sorted(rounds_data.keys(), reverse=True):
-            summary += f"**Round {round_num} Summary:**\n"
-            round_actions = rounds_data[round_num]
-            invest_summary = []
-            for action in round_actions:
-                player_name = action['player_name']
-                if action['player_id'] == current_player.player_id:
-                    player_name = f"You ({action['player_name']})"
-                invest_summary.append(
-                    f"{player_name} invested {action['decision']} "
-                    f"({action['contribution']} than avg), payoff was {action['payoff']:.2f}."
-                )
-            summary += "- " + "\n- ".join(invest_summary) + "\n"
-
-            discussion_summary = []
-            summary += f"[Discussion after Round {round_num}]\n"
-            for action in round_actions:
-                player_name = action['player_name']
-                if action['player_id'] == current_player.player_id:
-                    player_name = "You"
-                if action['statement'] and action['statement'] != "N/A":
-                    discussion_summary.append(f"- {player_name} said: {action['statement']}")
-            if discussion_summary:
-                summary += "\n".join(discussion_summary) + "\n"
-            else:
-                summary += "- No discussion took place.\n"
-            summary += "\n"
+    def _add_running_totals(self, round_num, round_actions):
+        """Extends the per-player cumulative (invested, earned) totals with one more round."""
+        totals = dict(self._running_totals.get(round_num - 1, {}))
+        for action in round_actions:
+            invested, earned = totals.get(action['player_id'], (0, 0.0))
+            totals[action['player_id']] = (invested + action['decision'], earned + action['payoff'])
+        self._running_totals[round_num] = totals
 
-        if not for_statement:
-            # --- CHANGE: Increment round number correctly for the prompt ---
-            summary += f"--- Your Turn (Round {self.current_round + 1}) ---\n"
-            summary += f"Your Total Bank: {current_player.bank:.2f}\n"
-            summary += (
-                f"Payoff Rules: Invest an integer from 0 to {self.investment_limit}. You keep what you don't invest. "
-                f"The common pot is multiplied by {self.multiplier} and shared equally."
+    def _condensed_history(self, first_round, last_round):
+        """Summarizes older rounds as each player's average investment and payoff."""
+        before = self._running_totals.get(first_round - 1, {})
+        num_rounds = last_round - first_round + 1
+        label = f"Round {first_round}" if first_round == last_round else f"Rounds {first_round}-{last_round}"
+        parts = [f"**{label} (condensed):**\n"]
+        for player_id, (invested, earned) in self._running_totals[last_round].items():
+            invested_before, earned_before = before.get(player_id, (0, 0.0))
+            parts.append(
+                f"- \0I{player_id}\0 invested {(invested - invested_before) / num_rounds:.2f} per round on average, "
+                f"average payoff {(earned - earned_before) / num_rounds:.2f}.\n"
             )
-        return summary
-    
+        parts.append("\n")
+        return "".join(parts)
+
     def _calculate_payoffs(self, decisions):
-        payoffs = {}
-        total_investment = sum(decisions.values())
-        total_pot = total_investment * self.multiplier
-        share = total_pot / len(self.players) if self.players else 0
-        for pid, investment in decisions.items():
-            payoffs[pid] = (self.investment_limit - investment) + share
-        return payoffs
+        investments = np.fromiter(decisions.values(), dtype=np.float64, count=len(decisions))
+        # A single round is a one-row batch
+        payoffs = self._calculate_payoffs_batch(investments[np.newaxis, :])[0]
+        # tolist() hands back plain floats, which the session and JSON log require
+        return dict(zip(decisions.keys(), payoffs.tolist()))
+
+    def _calculate_payoffs_batch(self, decisions_matrix):
+        """
+        Payoffs for an (n_games, n_players) array of investments, in one broadcast. The pot
+        is shared among all of the game's players, including any without a decision.
+        """
+        investments = np.asarray(decisions_matrix, dtype=np.float64)
+        shares = investments.sum(axis=1, keepdims=True) * self.multiplier / len(self.players) if self.players else 0
+        return (self.investment_limit - investments) + shares
+
+    def simulate_batch(self, decisions_matrix):
+        """Round payoffs under this game's rules for many sets of investments at once.
+
+        Row g of decisions_matrix is one round's investments, column j those of
+        self.players[j]; the result is a float64 array of the same shape.
+        """
+        # The numba kernel is compiled for C-contiguous float64 input
+        investments = np.ascontiguousarray(decisions_matrix, dtype=np.float64)
+        if investments.ndim != 2 or investments.shape[1] != len(self.players):
+            raise ValueError(f"Expected an (n_games, {len(self.players)}) array, got shape {investments.shape}.")
+        try:
+            # Imported here, not at module load, so web workers never pay numba's import cost
+            from _numba_payoffs import payoffs_batch
+        except ImportError: # numba is optional; the NumPy broadcast computes the same payoffs
+            return self._calculate_payoffs_batch(investments)
+        return payoffs_batch(investments, float(self.multiplier), float(self.investment_limit))
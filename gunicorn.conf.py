@@ -0,0 +1,13 @@
+# Gunicorn settings, picked up automatically by `gunicorn wsgi:app`.
+import multiprocessing
+
+# Several worker processes so slow LLM-bound requests don't block other users.
+workers = multiprocessing.cpu_count()
+# Threaded workers rather than gevent: request threads spend their time waiting on
+# LLM APIs, and each round runs its own asyncio loop, whether in a request thread or
+# (for all-AI games) on the app's background simulation_executor.
+worker_class = "gthread"
+threads = 4
+# All-AI games simulate in the background; interactive turns still wait on one round
+# of LLM calls inside the request.
+timeout = 120